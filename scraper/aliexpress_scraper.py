@@ -1,205 +1,464 @@
 # scraper/aliexpress_scraper.py
 import asyncio
-import json
-from typing import List, Dict
-from urllib.parse import urlencode, urlparse, parse_qs, urlunparse
-from playwright.async_api import async_playwright, Browser, Page
-from tqdm.asyncio import tqdm_asyncio
+import math
+import os
+import struct
+import aiofiles
+import httpx
+import orjson
+import re
+from typing import List, Dict, Optional, Union
+from urllib.parse import urljoin
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Route
+from pybloom_live import ScalableBloomFilter
+from selectolax.lexbor import LexborHTMLParser
+from tqdm import tqdm
 
 from .config import Config
 from .logger import setup_logger
-from .utils import clean_price, extract_sold_count, random_delay
-from .brightdata import fetch_via_brightdata
+from .utils import clean_products
+from .brightdata import create_brightdata_client, fetch_via_brightdata
+from .throttle import AdmissionController, TokenBucket
 
 logger = setup_logger(__name__)
 DEFAULT_TIMEOUT = 30000  # 30 seconds — safer for slow network/pages
+# Resource types with no value for product extraction — aborted for every pooled context
+BLOCKED_RESOURCE_TYPES = ("image", "font", "media", "stylesheet", "other")
+PRODUCT_SELECTOR = 'a[href*=".html"][href*="/item/"]'  # resilient generic selector
+PRODUCT_BASE_URL = "https://www.aliexpress.com/"
+# Sentinel URL served from fetched HTML — on the AliExpress origin so relative
+# hrefs/scripts resolve the same way as in the selectolax path
+INJECT_URL = urljoin(PRODUCT_BASE_URL, "__inject__")
+MIN_STATIC_ITEM_LINKS = 20  # '/item/<id>.html' links needed to trust the static HTML
+OUTPUT_BUFFER_SIZE = 1 << 16  # 64 KiB write buffer for the NDJSON output
+
+_PRODUCT_ID_RE = re.compile(r"/item/(\d+)\.html")
+_PAGE_PARAM_RE = re.compile(r"([?&]page=)[^&#]*")
+_last_dump_hashes: Dict[str, int] = {}  # debug file path -> hash of last HTML written
+
+
+class ContextUnavailableError(RuntimeError):
+    """Raised when a pooled browser page/context is no longer usable."""
 
 
 def with_page_param(url: str, page_num: int) -> str:
     """Append or update 'page' query param for AliExpress URLs."""
-    parsed = urlparse(url)
-    qs = parse_qs(parsed.query)
-    qs["page"] = [str(page_num)]
-    new_query = urlencode({k: v[0] for k, v in qs.items()})
-    new_parsed = parsed._replace(query=new_query)
-    return urlunparse(new_parsed)
+    new_url, count = _PAGE_PARAM_RE.subn(lambda m: f"{m.group(1)}{page_num}", url, count=1)
+    if count:
+        return new_url
+    base, sep, fragment = url.partition("#")
+    joiner = "&" if "?" in base else "?"
+    return f"{base}{joiner}page={page_num}{sep}{fragment}"
+
+
+def looks_fully_rendered(html: str) -> bool:
+    """Cheap regex probe for HTML that already contains the product cards."""
+    for count, _ in enumerate(_PRODUCT_ID_RE.finditer(html), start=1):
+        if count >= MIN_STATIC_ITEM_LINKS:
+            return True
+    return False
+
+
+def _node_text(card, selector: str) -> Optional[str]:
+    """Return the stripped text of the first node matching `selector`, if any."""
+    node = card.css_first(selector)
+    if node is None:
+        return None
+    return node.text(separator=" ", strip=True) or None
+
+
+def parse_products_from_html(html: str) -> List[Dict]:
+    """
+    Extract all product info from raw category HTML in-process (selectolax),
+    mirroring the fields produced by parse_products_from_page.
+    """
+    tree = LexborHTMLParser(html)
+    products = []
+
+    for card in tree.css(PRODUCT_SELECTOR):
+        href = card.attributes.get("href")
+        product_url = urljoin(PRODUCT_BASE_URL, href) if href else None
+
+        amount_sold = _node_text(card, '[class*="sold"], [class*="Sale"], [class*="orders"]') or "0 sold"
+
+        img = card.css_first("img")
+        thumbnail = None
+        if img is not None:
+            src = img.attributes.get("src") or img.attributes.get("data-src")
+            thumbnail = urljoin(PRODUCT_BASE_URL, src) if src else None
+
+        match = _PRODUCT_ID_RE.search(product_url) if product_url else None
+
+        products.append({
+            "product_title": _node_text(card, 'h3, .multi--titleText--nXeOv, [class*="title"]') or "N/A",
+            "product_url": product_url,
+            "product_id": match.group(1) if match else None,
+            "price": _node_text(card, '[class*="price"], [class*="Price"], [class*="currency"]'),
+            "amount_sold": amount_sold,
+            "amount_sold_count": amount_sold,
+            "product_rating": _node_text(card, '[class*="rating"], [class*="star"]'),
+            "product_thumbnail": thumbnail,
+        })
+
+    return clean_products(products)
+
+
+# Product extraction function, registered once per context via add_init_script
+EXTRACT_PRODUCTS_SCRIPT = '''
+    window.__extractProducts = (selector) => {
+        return Array.from(document.querySelectorAll(selector), card => {
+            const titleElem = card.querySelector('h3, .multi--titleText--nXeOv, [class*="title"]');
+            const title = titleElem?.innerText?.trim() || "N/A";
+
+            let productUrl = card.href;
+            if (productUrl?.startsWith("//")) {
+                productUrl = "https:" + productUrl;
+            }
+
+            const priceElem = card.querySelector('[class*="price"], [class*="Price"], [class*="currency"]');
+            const price = priceElem?.innerText?.trim() || null;
+
+            const soldElem = card.querySelector('[class*="sold"], [class*="Sale"], [class*="orders"]');
+            const amountSold = soldElem?.innerText?.trim() || "0 sold";
+
+            const ratingElem = card.querySelector('[class*="rating"], [class*="star"]');
+            const productRating = ratingElem?.innerText?.trim() || null;
+
+            const img = card.querySelector('img');
+            const thumbnail = img?.src || img?.dataset?.src || null;
+
+            let product_id = null;
+            try {
+                const m = productUrl && productUrl.match(/\\/item\\/(\\d+)\\.html/);
+                product_id = m ? m[1] : null;
+            } catch (e) {}
+
+            return {
+                product_title: title,
+                product_url: productUrl,
+                product_id: product_id,
+                price: price,
+                amount_sold: amountSold,
+                amount_sold_count: amountSold,
+                product_rating: productRating,
+                product_thumbnail: thumbnail
+            };
+        });
+    };
+'''
 
 
 async def parse_products_from_page(page: Page) -> List[Dict]:
-    """Extract all product info from the AliExpress category page."""
-    selector = 'a[href*=".html"][href*="/item/"]'  # resilient generic selector
-
-    raw_products = await page.eval_on_selector_all(selector, '''
-        (cards) => {
-            return cards.map(card => {
-                const titleElem = card.querySelector('h3, .multi--titleText--nXeOv, [class*="title"]');
-                const title = titleElem?.innerText?.trim() || "N/A";
-
-                let productUrl = card.href;
-                if (productUrl?.startsWith("//")) {
-                    productUrl = "https:" + productUrl;
-                }
-
-                const priceElem = card.querySelector('[class*="price"], [class*="Price"], [class*="currency"]');
-                const price = priceElem?.innerText?.trim() || null;
-
-                const soldElem = card.querySelector('[class*="sold"], [class*="Sale"], [class*="orders"]');
-                const amountSold = soldElem?.innerText?.trim() || "0 sold";
-
-                const ratingElem = card.querySelector('[class*="rating"], [class*="star"]');
-                const productRating = ratingElem?.innerText?.trim() || null;
-
-                const img = card.querySelector('img');
-                const thumbnail = img?.src || img?.dataset?.src || null;
-
-                let product_id = null;
-                try {
-                    const m = productUrl && productUrl.match(/\\/item\\/(\\d+)\\.html/);
-                    product_id = m ? m[1] : null;
-                } catch (e) {}
-
-                return {
-                    product_title: title,
-                    product_url: productUrl,
-                    product_id: product_id,
-                    price: price,
-                    amount_sold: amountSold,
-                    amount_sold_count: amountSold,
-                    product_rating: productRating,
-                    product_thumbnail: thumbnail
-                };
-            });
-        }
-    ''')
-
-    for item in raw_products:
-        item["price"] = clean_price(item.get("price"))
-        item["amount_sold_count"] = extract_sold_count(item.get("amount_sold"))
-
-    return raw_products
-
-
-async def scrape_single_page(browser: Browser, url: str, retries: int = Config.MAX_RETRIES) -> List[Dict]:
+    """
+    Extract all product info from the AliExpress category page.
+    Calls the extraction function installed once per context by EXTRACT_PRODUCTS_SCRIPT.
+    """
+    raw_products = await page.evaluate(
+        "selector => window.__extractProducts(selector)", PRODUCT_SELECTOR
+    )
+
+    return clean_products(raw_products)
+
+
+async def dump_debug_html(path: str, html: str):
+    """Write HTML to a debug file without blocking the event loop, skipping unchanged content."""
+    digest = hash(html)
+    if _last_dump_hashes.get(path) == digest:
+        return
+    async with aiofiles.open(path, "w", encoding="utf-8") as f:
+        await f.write(html)
+    _last_dump_hashes[path] = digest
+
+
+async def _block_nonessential_resources(route: Route):
+    """Abort images, fonts, media, stylesheets and beacons; let everything else through."""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class InjectedPage:
+    """
+    Persistent pooled page that renders Bright Data HTML by fulfilling
+    navigations to a sentinel URL, instead of goto + set_content per attempt.
+    """
+
+    def __init__(self, context: BrowserContext, page: Page):
+        self.context = context
+        self.page = page
+        self.html = ""
+        self.crashed = False
+        # A crashed renderer leaves the page open but unusable
+        page.on("crash", self._on_crash)
+
+    @classmethod
+    async def create(cls, browser: Browser) -> "InjectedPage":
+        context = await browser.new_context(
+            viewport=Config.VIEWPORT,
+            user_agent=Config.USER_AGENT,
+        )
+        await context.route("**/*", _block_nonessential_resources)
+        await context.add_init_script(EXTRACT_PRODUCTS_SCRIPT)
+        page = await context.new_page()
+        slot = cls(context, page)
+        await page.route("**/*", slot._handle_route)
+        return slot
+
+    def _on_crash(self, page: Page):
+        self.crashed = True
+
+    @property
+    def is_broken(self) -> bool:
+        """True once the page has closed or its renderer has crashed."""
+        return self.crashed or self.page.is_closed()
+
+    async def _handle_route(self, route: Route):
+        if route.request.url == INJECT_URL:
+            await route.fulfill(status=200, body=self.html, content_type="text/html")
+        else:
+            await route.fallback()
+
+    async def load(self, html: str):
+        """Serve `html` from the sentinel URL and navigate the page to it."""
+        self.html = html
+        await self.page.goto(INJECT_URL, wait_until="domcontentloaded")
+
+    async def close(self):
+        await self.context.close()
+
+
+async def scrape_single_page(
+    slot: InjectedPage,
+    client: httpx.AsyncClient,
+    url: str,
+    admission: AdmissionController,
+    retries: int = Config.MAX_RETRIES,
+) -> List[Dict]:
     """
     Fetch and parse a single category page using Bright Data,
     with exponential backoff, debug HTML save, and capped retries.
+    Complete HTML is parsed in-process; otherwise it is rendered into the
+    slot's persistent page. The slot is owned by the pool.
     """
     for attempt in range(1, retries + 1):
+        # A closed or crashed page means the pooled slot is broken, so let the caller replace it
+        if slot.is_broken:
+            raise ContextUnavailableError("Pooled page has been closed or crashed")
+
         try:
-            logger.info(f"🌐 [Page Fetch Attempt {attempt}/{retries}] {url}")
+            logger.info("[Page Fetch Attempt %d/%d] %s", attempt, retries, url)
 
-            html = fetch_via_brightdata(url)
+            html = await fetch_via_brightdata(client, url, admission)
             if not html or "<html" not in html:
                 raise RuntimeError("Empty or invalid HTML response from Bright Data")
 
             # Debug save for inspection (optional)
-            if attempt == 1:
-                with open("last_fetched_page.html", "w", encoding="utf-8") as f:
-                    f.write(html)
-
-            # Setup Playwright context
-            context = await browser.new_context(
-                viewport=Config.VIEWPORT,
-                user_agent=Config.USER_AGENT,
-            )
-            page = await context.new_page()
-            await page.goto("about:blank")
-            await page.set_content(html, wait_until="domcontentloaded")
-
-            selector = 'a[href*=".html"][href*="/item/"]'
+            if attempt == 1 and Config.DEBUG_DUMP_HTML:
+                await dump_debug_html("last_fetched_page.html", html)
+
+            # Fast path: Bright Data usually returns fully rendered HTML, so parse it
+            # in-process and skip the browser entirely
+            if looks_fully_rendered(html):
+                products = parse_products_from_html(html)
+                if products:
+                    logger.info("Parsed %d products from %s", len(products), url)
+                    return products
+
+            # Fallback: render in Playwright (e.g. a challenge page that needs JS)
+            logger.info("Static HTML incomplete for %s, rendering with Playwright...", url)
+            page = slot.page
+            await slot.load(html)
+
             try:
-                await page.wait_for_selector(selector, timeout=DEFAULT_TIMEOUT)
+                await page.wait_for_selector(PRODUCT_SELECTOR, timeout=DEFAULT_TIMEOUT)
             except Exception:
-                logger.warning(f"⚠️ No product links found for {url}. Saving debug HTML...")
-                with open("debug_failed_page.html", "w", encoding="utf-8") as f:
-                    f.write(html)
+                logger.warning("No product links found for %s.", url)
+                if Config.DEBUG_DUMP_HTML:
+                    await dump_debug_html("debug_failed_page.html", html)
                 raise RuntimeError("No valid product selector found on page.")
 
-            # Simulated scrolling (helps lazy-loaded DOM)
-            await page.evaluate("window.scrollTo(0, document.body.scrollHeight / 2)")
-            await random_delay(Config.BASE_DELAY, *Config.RANDOM_DELAY_RANGE)
-            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            await random_delay(Config.BASE_DELAY, *Config.RANDOM_DELAY_RANGE)
-
             products = await parse_products_from_page(page)
-            await context.close()
 
-            logger.info(f"✅ Parsed {len(products)} products from {url}")
+            logger.info("Parsed %d products from %s", len(products), url)
             return products
 
         except Exception as e:
+            # Errors caused by a dead page/context are not retryable on this slot
+            if slot.is_broken:
+                raise ContextUnavailableError(str(e)) from e
+
             delay = Config.calculate_retry_delay(attempt)
             if attempt < retries:
                 logger.warning(
-                    f"⚠️ Error scraping page (attempt {attempt}/{retries}): {e}\n"
-                    f"🔁 Retrying in {delay:.2f}s..."
+                    "Error scraping page (attempt %d/%d): %s\nRetrying in %.2fs...",
+                    attempt, retries, e, delay,
                 )
                 await asyncio.sleep(delay)
             else:
-                logger.error(f"❌ Max retries reached for {url}: {e}")
+                logger.error("❌ Max retries reached for %s: %s", url, e)
                 return []
 
 
-async def scrape_pages(
-    start_url: str = Config.START_URL,
-    pages: int = Config.TOTAL_PAGES,
-    concurrency: int = Config.CONCURRENCY_LIMIT,
-    output_file: str = Config.OUTPUT_FILE,
-):
-    """Main scraper routine for multiple pages with concurrency, NDJSON output, and tqdm progress bar."""
-    semaphore = asyncio.Semaphore(concurrency)
-    seen_urls = set()
+def dedup_key(item: Dict) -> Optional[Union[int, str]]:
+    """
+    Identity used for deduplication: the numeric product ID, which is stable
+    and much shorter than the tracking-laden URL. Falls back to the URL.
+    """
+    product_id = item.get("product_id")
+    if product_id and product_id.isdigit():
+        return int(product_id)
+    return item.get("product_url") or None
+
 
-    # Load existing URLs to avoid duplicates
+def load_seen_filter(filter_file: str, output_file: str) -> ScalableBloomFilter:
+    """
+    Load the persisted Bloom filter of seen products (see dedup_key).
+    When no filter exists yet, seed a new one from the existing NDJSON output once.
+    """
+    try:
+        with open(filter_file, "rb") as fh:
+            return ScalableBloomFilter.fromfile(fh)
+    except FileNotFoundError:
+        pass
+    except (EOFError, struct.error, ValueError) as e:
+        logger.warning("Seen filter %s is unreadable (%s), rebuilding from %s", filter_file, e, output_file)
+
+    seen = ScalableBloomFilter(
+        initial_capacity=Config.SEEN_FILTER_CAPACITY,
+        error_rate=Config.SEEN_FILTER_ERROR_RATE,
+    )
     try:
-        with open(output_file, "r", encoding="utf-8") as fh:
+        with open(output_file, "rb") as fh:
             for line in fh:
                 try:
-                    obj = json.loads(line.strip())
-                    if obj.get("product_url"):
-                        seen_urls.add(obj["product_url"])
-                except Exception:
+                    obj = orjson.loads(line)
+                except orjson.JSONDecodeError:
                     continue
+                if isinstance(obj, dict):
+                    key = dedup_key(obj)
+                    if key is not None:
+                        seen.add(key)
     except FileNotFoundError:
         pass
+    return seen
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=Config.HEADLESS)
 
-        async def worker(page_num: int):
-            page_url = with_page_param(start_url, page_num)
-            async with semaphore:
-                await random_delay(Config.BASE_DELAY, *Config.RANDOM_DELAY_RANGE)
-                products = await scrape_single_page(browser, page_url)
-
-                new_items = [
-                    item for item in products
-                    if item.get("product_url") and item["product_url"] not in seen_urls
-                ]
-
-                for it in new_items:
-                    seen_urls.add(it["product_url"])
-
-                if new_items:
-                    with open(output_file, "a", encoding="utf-8") as out:
-                        for it in new_items:
-                            out.write(json.dumps(it, ensure_ascii=False) + "\n")
+def save_seen_filter(seen: ScalableBloomFilter, filter_file: str):
+    """
+    Persist the Bloom filter of seen products for the next run.
+    Written to a temp file and swapped in atomically so an interrupted save
+    never leaves a truncated filter behind.
+    """
+    tmp_file = filter_file + ".tmp"
+    with open(tmp_file, "wb") as fh:
+        seen.tofile(fh)
+    os.replace(tmp_file, filter_file)
 
-                logger.info(f"📦 Page {page_num}: saved {len(new_items)} new products")
-                return len(new_items)
 
-        logger.info(f"🚀 Starting scrape for {pages} pages (concurrency={concurrency})...")
+async def scrape_pages(
+    start_url: str = Config.START_URL,
+    pages: int = Config.TOTAL_PAGES,
+    concurrency: int = Config.CONCURRENCY_LIMIT,
+    output_file: str = Config.OUTPUT_FILE,
+):
+    """Main scraper routine for multiple pages with concurrency, NDJSON output, and tqdm progress bar."""
+    # Dynamic admission control — shrinks on Bright Data throttling, regrows on success
+    admission = AdmissionController(concurrency, grow_after=Config.CONCURRENCY_GROW_AFTER)
 
-        results = await tqdm_asyncio.gather(
-            *[worker(i) for i in range(1, pages + 1)],
-            desc="Scraping Progress",
-            total=pages,
-        )
+    # One rate limiter shared by all workers smooths outbound requests to Bright Data
+    interval = Config.page_interval()
+    rate = concurrency / interval if interval > 0 else math.inf
+    bucket = TokenBucket(rate, burst=1)
+    seen_filter_file = Config.SEEN_FILTER_FILE or f"{output_file}.seen-ids.bloom"
+    seen_products = load_seen_filter(seen_filter_file, output_file)
 
-        total_new = sum(r for r in results if isinstance(r, int))
-        logger.info(f"🏁 Finished scraping {pages} pages. Total new: {total_new}")
+    # Single buffered output handle for the whole run, shared by all workers
+    out_fh = open(output_file, "ab", buffering=OUTPUT_BUFFER_SIZE)
+    write_lock = asyncio.Lock()
+    pages_written = 0
 
-        await browser.close()
+    try:
+        # Shared Bright Data client — connections are reused across all page fetches
+        async with create_brightdata_client(concurrency) as client, async_playwright() as p:
+            browser = await p.chromium.launch(headless=Config.HEADLESS)
+
+            # One browser, many long-lived contexts: each slot's context and page are
+            # created once (in parallel) and handed to workers through the queue
+            page_pool: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+            slots = await asyncio.gather(*[InjectedPage.create(browser) for _ in range(concurrency)])
+            for slot in slots:
+                page_pool.put_nowait(slot)
+
+            async def worker(page_num: int):
+                nonlocal pages_written
+                page_url = with_page_param(start_url, page_num)
+                async with admission:
+                    await bucket.take()
+                    slot = await page_pool.get()
+                    products = []
+                    try:
+                        # A broken slot is replaced and the page scraped again on the new one
+                        for _ in range(Config.MAX_RETRIES):
+                            try:
+                                products = await scrape_single_page(slot, client, page_url, admission)
+                                break
+                            except ContextUnavailableError as e:
+                                logger.error("💥 Discarding broken context for page %d: %s", page_num, e)
+                                try:
+                                    await slot.close()
+                                except Exception:
+                                    pass
+                                slot = await InjectedPage.create(browser)
+                    finally:
+                        page_pool.put_nowait(slot)
+
+                    new_items = []
+                    for item in products:
+                        key = dedup_key(item)
+                        if key is not None and key not in seen_products:
+                            seen_products.add(key)
+                            new_items.append(item)
+
+                    if new_items:
+                        batch = b"".join(orjson.dumps(it) + b"\n" for it in new_items)
+                        async with write_lock:
+                            out_fh.write(batch)
+                            pages_written += 1
+                            if pages_written % Config.FLUSH_EVERY_PAGES == 0:
+                                out_fh.flush()
+
+                    logger.info("Page %d: saved %d new products", page_num, len(new_items))
+                    return len(new_items)
+
+            logger.info("🚀 Starting scrape for %d pages (concurrency=%d)...", pages, concurrency)
+
+            # Consume pages as they finish so progress ticks per page; on interruption,
+            # pending pages are cancelled while already-written results are kept
+            tasks = [asyncio.create_task(worker(i)) for i in range(1, pages + 1)]
+            total_new = 0
+            try:
+                with tqdm(total=pages, desc="Scraping Progress") as pbar:
+                    for next_done in asyncio.as_completed(tasks):
+                        try:
+                            total_new += await next_done
+                        except Exception as e:
+                            logger.error("❌ Page worker failed: %s", e)
+                        pbar.update(1)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+            logger.info("🏁 Finished scraping %d pages. Total new: %d", pages, total_new)
+
+            while not page_pool.empty():
+                await page_pool.get_nowait().close()
+            await browser.close()
+    finally:
+        # Output and seen-filter are persisted together so they never drift apart
+        out_fh.close()
+        save_seen_filter(seen_products, seen_filter_file)
     return total_new
 
 
@@ -1,64 +1,93 @@
 # scraper/brightdata.py
-import time
-import requests
+import asyncio
+import re
+import httpx
+import orjson
 from typing import Optional
 from .config import Config
 from .logger import setup_logger
+from .throttle import AdmissionController
 
 logger = setup_logger(__name__)
 
+STREAM_CHUNK_SIZE = 1 << 15  # 32 KiB reads from the streamed response body
+_HTML_TAG_RE = re.compile(rb"<html", re.IGNORECASE)
 
-def fetch_via_brightdata(url: str) -> Optional[str]:
+_HEADERS = {
+    "Authorization": f"Bearer {Config.BRIGHTDATA_API_KEY}",
+    "Content-Type": "application/json"
+}
+
+# zone: adjust per your Bright Data account; format 'raw' ensures Bright Data returns pure HTML
+_PAYLOAD_TEMPLATE = b'{"zone":"web_unlocker1","url":%s,"format":"raw"}'
+
+
+def create_brightdata_client(concurrency: int) -> httpx.AsyncClient:
+    """
+    Create the shared HTTP/2 client used for all Bright Data requests.
+    Connections (and TLS sessions) are pooled and reused across page fetches.
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=60,
+        limits=httpx.Limits(
+            max_connections=concurrency * 2,
+            max_keepalive_connections=concurrency,
+        ),
+    )
+
+
+async def fetch_via_brightdata(
+    client: httpx.AsyncClient,
+    url: str,
+    admission: AdmissionController,
+) -> Optional[str]:
     """
     Fetch page HTML using Bright Data Web Unlocker API.
     Returns the raw HTML (string), not JSON.
     Includes exponential backoff with jitter and logging.
+    Every response status is reported to `admission` so concurrency adapts to throttling.
     """
-    logger.info(f"🌐 Fetching via Bright Data: {url}")
-
-    headers = {
-        "Authorization": f"Bearer {Config.BRIGHTDATA_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    logger.info("Fetching via Bright Data: %s", url)
 
-    payload = {
-        "zone": "web_unlocker1",  # Adjust zone name per your Bright Data account
-        "url": url,
-        "format": "raw"           # 'raw' ensures Bright Data returns pure HTML
-    }
+    # Only the URL varies, so the request body is encoded once for all attempts
+    payload = _PAYLOAD_TEMPLATE % orjson.dumps(url)
 
     for attempt in range(1, Config.MAX_RETRIES + 1):
         try:
-            response = requests.post(
+            async with client.stream(
+                "POST",
                 Config.BRIGHTDATA_API_URL,
-                json=payload,
-                headers=headers,
-                timeout=60
-            )
+                content=payload,
+                headers=_HEADERS,
+            ) as response:
+                await admission.record(response.status_code)
 
-            # ✅ Successful request
-            if response.status_code == 200:
-                html = response.text.strip()
-                if html and "<html" in html.lower():
-                    logger.info(f"✅ Success on attempt {attempt}")
-                    return html
+                # ✅ Successful request
+                if response.status_code == 200:
+                    chunks = [chunk async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE)]
+                    raw_html = b"".join(chunks)
+                    if _HTML_TAG_RE.search(raw_html):
+                        logger.info("Success on attempt %d", attempt)
+                        return raw_html.decode(response.encoding or "utf-8", "replace")
+                    else:
+                        logger.warning("Empty or malformed HTML received on attempt %d.", attempt)
                 else:
-                    logger.warning(f"⚠️ Empty or malformed HTML received on attempt {attempt}.")
-            else:
-                logger.warning(
-                    f"⚠️ Bright Data returned {response.status_code}: "
-                    f"{response.text[:200]}"
-                )
+                    await response.aread()
+                    logger.warning(
+                        "Bright Data returned %d: %s",
+                        response.status_code, response.text[:200],
+                    )
 
         except Exception as e:
-            logger.error(f"💥 Exception on attempt {attempt}: {str(e)}")
+            logger.error("Exception on attempt %d: %s", attempt, e)
 
         # Retry with backoff + jitter
         if attempt < Config.MAX_RETRIES:
             delay = Config.calculate_retry_delay(attempt)
-            logger.info(f"🔁 Retrying in {delay:.2f}s (attempt {attempt + 1}/{Config.MAX_RETRIES})...")
-            time.sleep(delay)
+            logger.info("Retrying in %.2fs (attempt %d/%d)...", delay, attempt + 1, Config.MAX_RETRIES)
+            await asyncio.sleep(delay)
         else:
-            logger.error(f"❌ All {Config.MAX_RETRIES} attempts failed for {url}")
+            logger.error("❌ All %d attempts failed for %s", Config.MAX_RETRIES, url)
 
     return None
@@ -1,10 +1,17 @@
 # scraper/config.py
 import os
+from random import uniform
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+
+def _backoff_table(base: float, factor: float, cap: float, size: int) -> tuple:
+    """Precompute the deterministic (capped) part of the retry delay for attempts 1..size."""
+    return tuple(min(base * factor ** i, cap) for i in range(size))
+
+
 class Config:
     """
     Central configuration class for AliExpress scraper.
@@ -30,6 +37,9 @@ class Config:
     # Concurrency — number of pages processed in parallel
     CONCURRENCY_LIMIT = int(os.getenv("CONCURRENCY_LIMIT", "3"))
 
+    # Consecutive successful fetches before a throttled concurrency limit grows back by one
+    CONCURRENCY_GROW_AFTER = int(os.getenv("CONCURRENCY_GROW_AFTER", "10"))
+
     # Number of retry attempts per page in case of Bright Data or parsing errors
     MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
 
@@ -49,12 +59,23 @@ class Config:
     RETRY_JITTER = float(os.getenv("RETRY_JITTER", "1.0"))               # Random jitter to avoid synchronization
     RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30.0"))        # Cap maximum delay between retries (in seconds)
 
+    # Backoff without jitter, indexed by attempt - 1 (computed once at import)
+    _RETRY_BASE = _backoff_table(RETRY_BASE_DELAY, RETRY_BACKOFF_FACTOR, RETRY_MAX_DELAY, MAX_RETRIES + 2)
+
     # === Output ===
     OUTPUT_FILE = os.getenv("OUTPUT_FILE", "aliexpress_products.json")
 
     # Optional NDJSON output toggle (True = append line-by-line)
     USE_NDJSON = bool(int(os.getenv("USE_NDJSON", "1")))
 
+    # Flush the buffered NDJSON output after every N pages that produced new items
+    FLUSH_EVERY_PAGES = max(1, int(os.getenv("FLUSH_EVERY_PAGES", "5")))
+
+    # Persistent Bloom filter of seen product IDs (defaults to "<OUTPUT_FILE>.seen-ids.bloom")
+    SEEN_FILTER_FILE = os.getenv("SEEN_FILTER_FILE", "")
+    SEEN_FILTER_CAPACITY = int(os.getenv("SEEN_FILTER_CAPACITY", "100000"))
+    SEEN_FILTER_ERROR_RATE = float(os.getenv("SEEN_FILTER_ERROR_RATE", "0.0001"))
+
     # === Browser Settings ===
     HEADLESS = bool(int(os.getenv("HEADLESS", "1")))
     VIEWPORT = {"width": 1366, "height": 768}
@@ -68,6 +89,9 @@ class Config:
     # === Logging ===
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
+    # Save fetched/failed page HTML to disk for inspection (off by default)
+    DEBUG_DUMP_HTML = bool(int(os.getenv("DEBUG_DUMP_HTML", "0")))
+
     # === Helper Method for Backoff Calculation ===
     @classmethod
     def calculate_retry_delay(cls, attempt: int) -> float:
@@ -78,11 +102,18 @@ class Config:
             attempt = 2 → 4s
             attempt = 3 → 8s (but capped to RETRY_MAX_DELAY)
         """
-        from random import uniform
-        delay = cls.RETRY_BASE_DELAY * (cls.RETRY_BACKOFF_FACTOR ** (attempt - 1))
+        if attempt <= len(cls._RETRY_BASE):
+            delay = cls._RETRY_BASE[attempt - 1]
+        else:
+            delay = cls.RETRY_BASE_DELAY * (cls.RETRY_BACKOFF_FACTOR ** (attempt - 1))
         delay = min(delay + uniform(0, cls.RETRY_JITTER), cls.RETRY_MAX_DELAY)
         return round(delay, 2)
 
+    @classmethod
+    def page_interval(cls) -> float:
+        """Average per-worker spacing between page fetches: BASE_DELAY plus the mean random delay."""
+        return cls.BASE_DELAY + sum(cls.RANDOM_DELAY_RANGE) / 2
+
     @classmethod
     def summary(cls) -> str:
         """Return a readable summary of key configuration for debugging."""
@@ -95,7 +126,8 @@ class Config:
             f"factor={cls.RETRY_BACKOFF_FACTOR}, jitter={cls.RETRY_JITTER}s, "
             f"cap={cls.RETRY_MAX_DELAY}s\n"
             f"💾 OUTPUT_FILE: {cls.OUTPUT_FILE}\n"
-            f"⏳ BASE_DELAY: {cls.BASE_DELAY}s ± {cls.RANDOM_DELAY_RANGE}\n"
+            f"⏳ PAGE_INTERVAL: {cls.page_interval()}s per worker "
+            f"(BASE_DELAY={cls.BASE_DELAY}s + mean of {cls.RANDOM_DELAY_RANGE})\n"
             f"🧠 HEADLESS: {cls.HEADLESS}\n"
             f"🪶 USER_AGENT: {cls.USER_AGENT[:60]}..."
         )
@@ -1,11 +1,12 @@
 # scraper/logger.py
 import logging
 import sys
+from .config import Config
 
 def setup_logger(name: str = "scraper") -> logging.Logger:
     """Setup a named logger with colored console output."""
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(Config.LOG_LEVEL.upper())
 
     if not logger.handlers:
         handler = logging.StreamHandler(sys.stdout)
@@ -0,0 +1,90 @@
+# scraper/throttle.py
+import asyncio
+import math
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Bright Data status codes that signal we are being throttled
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class AdmissionController:
+    """
+    Concurrency limiter whose limit can shrink and grow while requests are in flight.
+    The limit drops by one on each throttling response and recovers by one after
+    `grow_after` consecutive successes, never exceeding `max_limit`.
+    """
+
+    def __init__(self, max_limit: int, grow_after: int = 10):
+        self._cond = asyncio.Condition()
+        self._in_flight = 0
+        self._max_limit = max_limit
+        self._cmax = max_limit
+        self._grow_after = grow_after
+        self._successes = 0
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self._cmax)
+            self._in_flight += 1
+
+    async def release(self):
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify(1)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    async def record(self, status_code: int):
+        """Adjust the concurrency limit based on an observed response status."""
+        async with self._cond:
+            if status_code in THROTTLE_STATUS_CODES:
+                self._successes = 0
+                if self._cmax > 1:
+                    self._cmax -= 1
+                    logger.warning("🐢 Throttled (%d) — concurrency reduced to %d", status_code, self._cmax)
+            elif status_code == 200:
+                self._successes += 1
+                if self._successes >= self._grow_after and self._cmax < self._max_limit:
+                    self._cmax += 1
+                    self._successes = 0
+                    logger.info("🐇 Concurrency restored to %d", self._cmax)
+                    self._cond.notify_all()
+
+
+class TokenBucket:
+    """
+    Shared rate limiter that admits `rate` requests per second on average,
+    allowing bursts of up to `burst`. Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if self._updated is not None:
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def take(self):
+        """Wait until a token is available, then consume it."""
+        if math.isinf(self._rate):
+            return
+
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            self._refill(loop.time())
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._refill(loop.time())
+            self._tokens -= 1
@@ -2,23 +2,35 @@
 import re
 import asyncio
 import random
-from typing import Optional
+from typing import Dict, List, Optional
+
+# Compiled once — these run for every product on every page
+_PRICE_STRIP_RE = re.compile(r'[^\d.,]')
+_SOLD_COUNT_RE = re.compile(r'(\d+[,\d]*)')
 
 def clean_price(text: Optional[str]) -> Optional[str]:
     if not text:
         return None
     # remove currency symbols, whitespace, non-digit except dot and comma
-    cleaned = re.sub(r'[^\d.,]', '', text)
+    cleaned = _PRICE_STRIP_RE.sub('', text)
     # normalize commas -> dots if necessary (site-specific)
     cleaned = cleaned.replace(',', '.')
     return cleaned.strip() if cleaned else None
 
 def extract_sold_count(text: Optional[str]) -> str:
-    match = re.search(r'(\d+[,\d]*)', text or "")
+    match = _SOLD_COUNT_RE.search(text or "")
     if not match:
         return "0"
     return match.group(1).replace(',', '')
 
+def clean_products(products: List[Dict]) -> List[Dict]:
+    """Clean price and sold-count fields for a whole page of products in place."""
+    for item in products:
+        item["price"] = clean_price(item.get("price"))
+        item["amount_sold_count"] = extract_sold_count(item.get("amount_sold"))
+
+    return products
+
 async def random_delay(base: float, min_add: float, max_add: float):
     delay = base + random.uniform(min_add, max_add)
     await asyncio.sleep(delay)